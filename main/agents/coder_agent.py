@@ -1,6 +1,7 @@
-import openai
-from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
-from main.config import OPENROUTER_API_KEY, MODEL, USE_YANDEX_GPT, YANDEX_CLOUD_API_KEY, YANDEX_CLOUD_FOLDER, YANDEX_CLOUD_MODEL
+import re
+from functools import cache
+
+from main.llm.agent import LLMAgent
 
 SYSTEM_PROMPT = """
 Ты — Coder Agent. Твоя задача — исправлять баги и добавлять функционал по issue.
@@ -21,70 +22,25 @@ SYSTEM_PROMPT = """
 Я не понял задачу или переполнился контекст
 """
 
-class LLMAgent:
-    def __init__(self):
-        if USE_YANDEX_GPT:
-            self.client = openai.OpenAI(
-                api_key=YANDEX_CLOUD_API_KEY,
-                base_url="https://rest-assistant.api.cloud.yandex.net/v1",
-                project=YANDEX_CLOUD_FOLDER,
-            )
-            self.model_id = f"gpt://{YANDEX_CLOUD_FOLDER}/{YANDEX_CLOUD_MODEL}"
-            self.is_yandex = True
-        else:
-            self.client = openai.OpenAI(api_key=OPENROUTER_API_KEY)
-            self.model_id = MODEL
-            self.is_yandex = False
-
-    async def run(self, prompt: str) -> str:
-        if self.is_yandex:
-            resp = self.client.responses.create(
-                model=self.model_id,
-                instructions=SYSTEM_PROMPT,
-                input=prompt,
-                temperature=0.3,
-                max_output_tokens=10000
-            )
-            return resp.output_text
-        else:
-            resp = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=[
-                    ChatCompletionSystemMessageParam(content=SYSTEM_PROMPT, role="system"),
-                    ChatCompletionUserMessageParam(content=prompt, role="user")
-                ],
-                temperature=0.3,
-                max_tokens=500
-            )
-            return resp.choices[0].message.content
+# Заголовок блока "=== путь ===" (знаков "=" может быть больше, внутри пути они допустимы)
+# и всё содержимое до следующего заголовка или конца ответа. Строка из одних "=" — не заголовок
+_HEADER = r"^={3,}[ \t]*%s[ \t]*={3,}[ \t]*\r?$"
+_PATH = r"[^=\s](?:[^\r\n]*?[^=\s])?"
+_FILE_RE = re.compile(
+    _HEADER % f"(?P<path>{_PATH})"
+    + r"\n?(?P<body>.*?)(?="
+    + _HEADER % _PATH
+    + r"|\Z)",
+    re.MULTILINE | re.DOTALL,
+)
 
 def parse_agent_diff(agent_response: str) -> dict[str, str]:
     """Преобразует ответ агента в словарь {путь_файла: новый_код}."""
-    files = {}
-    current_file = None
-    buffer = []
-
-    for line in agent_response.splitlines():
-        line = line.rstrip()
-        if line.startswith("===") and line.endswith("==="):
-            if current_file:
-                files[current_file] = "\n".join(buffer).strip()
-            current_file = line.strip("= ").strip()
-            buffer = []
-        else:
-            buffer.append(line)
-
-    if current_file:
-        files[current_file] = "\n".join(buffer).strip()
-    return files
-
-_agent: LLMAgent | None = None
+    return {m.group("path"): m.group("body").strip() for m in _FILE_RE.finditer(agent_response)}
 
+@cache
 def get_coder_agent() -> LLMAgent:
-    global _agent
-    if _agent is None:
-        _agent = LLMAgent()
-    return _agent
+    return LLMAgent(SYSTEM_PROMPT, max_tokens=500, max_output_tokens=10000)
 
 async def run_coder_agent(context: str, allowed_files: list[str]) -> dict[str, str]:
     """Запускает агента на контексте. Разрешены только файлы из allowed_files."""
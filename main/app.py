@@ -1,8 +1,9 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from main.git.github_app_webhooks import router as github_webhooks_router
 from main.logging import setup_logging
 
 setup_logging()
-app = FastAPI(title="GitHub App Client API")
+app = FastAPI(title="GitHub App Client API", default_response_class=ORJSONResponse)
 
 app.include_router(github_webhooks_router)
\ No newline at end of file
@@ -13,4 +13,19 @@ WEBHOOK_SECRET = os.environ["WEBHOOK_SECRET"]
 USE_YANDEX_GPT = os.environ.get("USE_YANDEX_GPT", "false").lower() == "true"
 YANDEX_CLOUD_FOLDER = os.environ.get("YANDEX_CLOUD_FOLDER")
 YANDEX_CLOUD_API_KEY = os.environ.get("YANDEX_CLOUD_API_KEY")
-YANDEX_CLOUD_MODEL = os.environ.get("YANDEX_CLOUD_MODEL")
\ No newline at end of file
+YANDEX_CLOUD_MODEL = os.environ.get("YANDEX_CLOUD_MODEL")
+
+# LLM cache
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "86400"))
+
+# LLM dispatcher
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "10"))
+LLM_MAX_REQUESTS_PER_MIN = int(os.environ.get("LLM_MAX_REQUESTS_PER_MIN", "60"))
+LLM_BATCH_POLL_INTERVAL = float(os.environ.get("LLM_BATCH_POLL_INTERVAL", "30"))
+
+# PR iterations
+PR_ITERATIONS_DB_PATH = os.environ.get("PR_ITERATIONS_DB_PATH", "pr_iterations.sqlite3")
+
+# Local repository clones
+REPO_CACHE_DIR = os.environ.get("REPO_CACHE_DIR", "/var/cache/repos")
@@ -1,224 +1,344 @@
-import hashlib
+import asyncio
+import binascii
 import hmac
 import logging
-from collections import defaultdict
-from typing import List
+import re
+from typing import Awaitable, Callable, List
 
+import msgspec
+from cachetools import TTLCache
 from fastapi import APIRouter, Request, Header, HTTPException
+from fastapi.responses import ORJSONResponse
 
 from main.agents.coder_agent import run_coder_agent
 from main.agents.reviewer_agent import run_reviewer_agent
 from main.config import WEBHOOK_SECRET
-from main.git.github_client import GitHubAppClient
+from main.git.github_client import MAX_FILE_SIZE, GitHubAppClient, get_installation_client
+from main.git.pr_iterations import pr_iterations
+from main.git.webhook_payloads import WebhookPayload, decode_webhook_payload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-PR_ITERATIONS = defaultdict(int)
 MAX_ITERATIONS = 5
 
-def verify_signature(payload: bytes, signature: str) -> bool:
+# Ответы webhook не зависят от запроса, поэтому собираются и сериализуются один раз
+_PONG = ORJSONResponse({"status": "pong"})
+_CODER_AGENT_COMPLETED = ORJSONResponse({"status": "coder agent completed"})
+_CHECK_RUN_WITHOUT_PR = ORJSONResponse({"status": "check_run without PR"})
+_REVIEWER_AGENT_COMPLETED = ORJSONResponse({"status": "reviewer agent completed"})
+_NOT_REVIEWER_COMMENT = ORJSONResponse({"status": "not reviewer comment"})
+_MAX_ITERATIONS_REACHED = ORJSONResponse({"status": "max iterations reached"})
+_REVIEW_APPROVED = ORJSONResponse({"status": "review approved"})
+_CODER_ITERATION_COMPLETED = ORJSONResponse({"status": "coder iteration completed"})
+_NO_CHANGES = ORJSONResponse({"status": "no changes"})
+_OK = ORJSONResponse({"status": "ok"})
+
+# События, после которых закешированные diff/CI статус PR становятся неактуальными
+_CACHE_INVALIDATING_EVENTS = {"push", "pull_request"}
+
+# check_run и следующий за ним issue_comment приходят с разницей в секунды — отдаем из памяти
+PR_CACHE_TTL_SECONDS = 30
+_PR_DIFF_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=PR_CACHE_TTL_SECONDS)
+_CI_STATUS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=PR_CACHE_TTL_SECONDS)
+
+# Ключ HMAC подготавливается один раз, на каждый запрос делается только copy()
+_SECRET = WEBHOOK_SECRET.encode()
+_HMAC_TEMPLATE = hmac.new(_SECRET, digestmod="sha256")
+
+# Подпись GitHub всегда "sha256=" + 64 hex-символа
+_SIGNATURE_PREFIX = b"sha256="
+_SIGNATURE_LENGTH = len(_SIGNATURE_PREFIX) + 64
+
+
+def is_well_formed_signature(signature: bytes | None) -> bool:
+    """Дешевая проверка формы заголовка до чтения тела и подсчета HMAC"""
+    return (
+        signature is not None
+        and len(signature) == _SIGNATURE_LENGTH
+        and signature.startswith(_SIGNATURE_PREFIX)
+    )
+
+
+def signature_matches(mac: hmac.HMAC, signature: bytes) -> bool:
+    """Сравнивает уже посчитанный HMAC тела с сырым заголовком X-Hub-Signature-256"""
+    if not signature.startswith(_SIGNATURE_PREFIX):
+        return False
+    try:
+        received = binascii.unhexlify(signature[len(_SIGNATURE_PREFIX):])
+    except ValueError:
+        return False
+    return hmac.compare_digest(mac.digest(), received)
+
+
+def verify_signature(payload: bytes, signature: bytes) -> bool:
     """Проверка подписи GitHub webhook"""
-    mac = hmac.new(WEBHOOK_SECRET.encode(), msg=payload, digestmod=hashlib.sha256)
-    return hmac.compare_digest(f"sha256={mac.hexdigest()}", signature)
+    mac = _HMAC_TEMPLATE.copy()
+    mac.update(payload)
+    return signature_matches(mac, signature)
+
+
+async def read_signed_body(request: Request, signature: bytes) -> bytes | None:
+    """
+    Читает тело запроса потоком, сразу прогоняя чанки через HMAC.
+    Возвращает тело, если подпись верна, иначе None.
+    """
+    mac = _HMAC_TEMPLATE.copy()
+    chunks = []
+    async for chunk in request.stream():
+        mac.update(chunk)
+        chunks.append(chunk)
+    if not signature_matches(mac, signature):
+        return None
+    return b"".join(chunks)
+
+
+def get_raw_signature(request: Request) -> bytes | None:
+    """Достает X-Hub-Signature-256 из сырых заголовков ASGI без декодирования в str"""
+    for name, value in request.headers.raw:
+        if name == b"x-hub-signature-256":
+            return value
+    return None
+
+
+def invalidate_pr_cache(repo_full_name: str, pr_number: int | None = None):
+    """Сбрасывает кеш diff/CI для PR, а без pr_number — для всех PR репозитория"""
+    for cache in (_PR_DIFF_CACHE, _CI_STATUS_CACHE):
+        for key in list(cache.keys()):
+            if key[0] == repo_full_name and (pr_number is None or key[1] == pr_number):
+                cache.pop(key, None)
+
+
+_REQUEST_CHANGES_RE = re.compile(r"request changes", re.IGNORECASE)
 
 
 def is_reviewer_comment(comment_body: str) -> bool:
     """Определяет, что комментарий оставил reviewer agent"""
-    return "Вердикт:" in comment_body or comment_body.startswith("[REVIEWER]")
+    return comment_body.startswith("[REVIEWER]") or "Вердикт:" in comment_body
+
+
+def requests_changes(comment_body: str) -> bool:
+    """Reviewer просит доработку; поиск без учета регистра без копии comment.lower()"""
+    return _REQUEST_CHANGES_RE.search(comment_body) is not None
 
 
 async def get_issue_comments(client: GitHubAppClient, repo_full_name: str, issue_number: int) -> List[str]:
     """Получение комментариев к issue"""
-    comments = client.get_issue(repo_full_name, issue_number).get_comments()
-    return [c.body for c in comments]
+    return await client.get_issue_comment_bodies(repo_full_name, issue_number)
 
 
 async def get_pr_diff(client: GitHubAppClient, repo_full_name: str, pr_number: int) -> str:
     """Получение diff PR в формате текста"""
-    pr = client.get_pull_request(repo_full_name, pr_number)
-    import requests
-    headers = {"Authorization": f"token {client.token}", "Accept": "application/vnd.github.v3.diff"}
-    resp = requests.get(pr.url, headers=headers)
-    return resp.text if resp.status_code == 200 else ""
+    key = (repo_full_name, pr_number)
+    diff = _PR_DIFF_CACHE.get(key)
+    if diff is None:
+        diff = await client.get_pull_request_diff(repo_full_name, pr_number)
+        if diff:
+            _PR_DIFF_CACHE[key] = diff
+    return diff
 
 
 async def get_ci_status(client: GitHubAppClient, repo_full_name: str, pr_number: int) -> str:
     """Получение текущего состояния CI для PR"""
-    pr = client.get_pull_request(repo_full_name, pr_number)
-    commits = pr.get_commits()
-    latest_commit = None
-    for commit in commits:
-        latest_commit = commit
-    if latest_commit is None:
-        return "no_ci"
-    statuses = latest_commit.get_statuses()
-    if statuses.totalCount == 0:
-        return "no_ci"
-    states = [s.state for s in statuses]
-    if "failure" in states:
-        return "failure"
-    if all(s == "success" for s in states):
-        return "success"
-    return "pending"
+    key = (repo_full_name, pr_number)
+    status = _CI_STATUS_CACHE.get(key)
+    if status is None:
+        status = await client.get_combined_ci_state(repo_full_name, pr_number)
+        _CI_STATUS_CACHE[key] = status
+    return status
+
+
+# ----------------- Coder Agent: открытие issue -----------------
+async def handle_issue_opened(payload: WebhookPayload, client: GitHubAppClient, repo_full_name: str) -> ORJSONResponse:
+    """Coder Agent: генерирует исправление по новому issue и открывает PR"""
+    issue_number = payload.issue.number
+    issue_title = payload.issue.title
+    issue_body = payload.issue.body or ""
+    comments = await get_issue_comments(client, repo_full_name, issue_number)
+
+    repo_contents = await client.read_repo_files(repo_full_name, ref="main")
+    # Править агенту разрешено только то, что он видел целиком; остальное — лишь заголовок
+    repo_files = [
+        path for path, content in repo_contents.items()
+        if content is not None and len(content) <= MAX_FILE_SIZE
+    ]
+    shown = set(repo_files)
+    files_context = [
+        f"=== {path} ===\n{content}" if path in shown else f"=== {path} === (skipped)"
+        for path, content in repo_contents.items()
+    ]
+
+    # Один join вместо цепочки "+", каждая из которых копировала весь текст файлов
+    context = "".join((
+        "Issue: ", issue_title,
+        "\nОписание: ", issue_body,
+        "\nКомментарии:\n", "\n".join(comments),
+        "\n\nСодержимое файлов репозитория:\n", "\n\n".join(files_context),
+    ))
+
+    files_to_update = await run_coder_agent(context, allowed_files=repo_files)
+
+    branch_name = f"issue-{issue_number}-fix"
+    await asyncio.to_thread(client.create_branch, repo_full_name, branch_name)
+
+    commit = await client.commit_files(
+        repo_full_name,
+        branch_name,
+        files_to_update,
+        f"Issue #{issue_number} fix via Coder Agent"
+    )
+    # Без коммита ветка совпадает с main — GitHub не даст открыть PR. Ветку удаляем,
+    # иначе повторная доставка того же issue упадет на create_branch с 422
+    if commit is None:
+        await asyncio.to_thread(client.delete_branch, repo_full_name, branch_name)
+        return _NO_CHANGES
+
+    pr = await asyncio.to_thread(
+        client.create_pull_request,
+        repo_full_name,
+        f"Fix for issue #{issue_number}",
+        branch_name,
+        "main",
+        body=f"Issue #{issue_number} fix via Coder Agent"
+    )
+
+    # Инициализируем итерацию
+    await pr_iterations.set(repo_full_name, pr.number, 1)
+
+    return _CODER_AGENT_COMPLETED
+
+
+# ----------------- Reviewer Agent: CI завершился -----------------
+async def handle_check_run_completed(payload: WebhookPayload, client: GitHubAppClient, repo_full_name: str) -> ORJSONResponse:
+    """Reviewer Agent: ревью PR после завершения CI"""
+    prs = payload.check_run.pull_requests
+    if not prs:
+        return _CHECK_RUN_WITHOUT_PR
+
+    pr_number = prs[0].number
+    pr = await asyncio.to_thread(client.get_pull_request, repo_full_name, pr_number)
+    pr_title = pr.title
+    pr_body = pr.body or ""
+    diff_text = await get_pr_diff(client, repo_full_name, pr_number)
+    conclusion = payload.check_run.conclusion
+
+    context = (
+        f"PR: {pr_title}\n"
+        f"Описание: {pr_body}\n"
+        f"Diff:\n{diff_text}\n"
+        f"CI статус: {conclusion}"
+    )
+
+    review_comment = await run_reviewer_agent(context)
+    await asyncio.to_thread(client.add_pr_comment, repo_full_name, pr_number, review_comment)
+
+    return _REVIEWER_AGENT_COMPLETED
+
+
+# ----------------- Coder Agent: реагирование на комментарий ревьювера -----------------
+async def handle_issue_comment_created(payload: WebhookPayload, client: GitHubAppClient, repo_full_name: str) -> ORJSONResponse:
+    """Coder Agent: доработка PR по комментарию ревьювера"""
+    comment = payload.comment.body
+
+    if not is_reviewer_comment(comment):
+        return _NOT_REVIEWER_COMMENT
+
+    pr_url = payload.issue.pull_request.url
+    pr_number = client.get_pr_number_from_url(pr_url)  # метод для получения PR номера
+
+    # Проверка лимита итераций
+    iteration = await pr_iterations.incr(repo_full_name, pr_number)
+    if iteration > MAX_ITERATIONS:
+        await asyncio.to_thread(
+            client.add_pr_comment,
+            repo_full_name,
+            pr_number,
+            "[SYSTEM] Max iterations reached. Manual intervention required."
+        )
+        return _MAX_ITERATIONS_REACHED
+
+    # Разбираем вердикт reviewer
+    verdict = "request changes" if requests_changes(comment) else "approve"
+    if verdict == "approve":
+        return _REVIEW_APPROVED
+
+    # Подготовка контекста для coder
+    pr = await asyncio.to_thread(client.get_pull_request, repo_full_name, pr_number)
+    pr_title = pr.title
+    pr_body = pr.body or ""
+    diff_text = await get_pr_diff(client, repo_full_name, pr_number)
+
+    context = (
+        f"PR: {pr_title}\n"
+        f"Описание: {pr_body}\n"
+        f"Текущий diff:\n{diff_text}\n\n"
+        f"Комментарий ревьювера:\n{comment}\n\n"
+        f"Итерация: {iteration} из {MAX_ITERATIONS}"
+    )
+
+    # get_files() — ленивый PaginatedList, страницы грузятся при итерации
+    allowed_files = await asyncio.to_thread(lambda: [f.filename for f in pr.get_files()])
+
+    files_to_update = await run_coder_agent(context, allowed_files=allowed_files)
+    branch_name = pr.head.ref
+
+    await client.commit_files(
+        repo_full_name,
+        branch_name,
+        files_to_update,
+        f"Fix after review iteration {iteration}"
+    )
+
+    return _CODER_ITERATION_COMPLETED
+
+
+# (event, action) -> обработчик; все остальные события отбрасываются до разбора тела
+WebhookHandler = Callable[[WebhookPayload, GitHubAppClient, str], Awaitable[ORJSONResponse]]
+HANDLERS: dict[tuple[str, str], WebhookHandler] = {
+    ("issues", "opened"): handle_issue_opened,
+    ("check_run", "completed"): handle_check_run_completed,
+    ("issue_comment", "created"): handle_issue_comment_created,
+}
+_HANDLED_EVENTS = {event for event, _ in HANDLERS}
+
 
 # ----------------- WEBHOOK -----------------
 @router.post("/webhook")
 async def github_webhook(
     request: Request,
-    x_hub_signature_256: str | None = Header(None),
     x_github_event: str | None = Header(None),
 ):
-    body = await request.body()
-    if not x_hub_signature_256 or not verify_signature(body, x_hub_signature_256):
+    signature = get_raw_signature(request)
+    body = await read_signed_body(request, signature) if is_well_formed_signature(signature) else None
+    if body is None:
         logger.warning("Invalid or missing signature")
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    payload = await request.json()
-
+    # ping приходит без installation, поэтому отвечаем до типизированного разбора
     if x_github_event == "ping":
-        return {"status": "pong"}
+        return _PONG
+
+    if x_github_event not in _HANDLED_EVENTS and x_github_event not in _CACHE_INVALIDATING_EVENTS:
+        logger.info("Unhandled event type: %s", x_github_event)
+        return _OK
 
     try:
-        installation_id = payload["installation"]["id"]
-        repo_full_name = payload["repository"]["full_name"]
-    except KeyError:
+        payload = decode_webhook_payload(body)
+    except msgspec.DecodeError:
         logger.exception("Malformed payload")
         raise HTTPException(status_code=400, detail="Malformed payload")
 
-    client = GitHubAppClient(installation_id)
-
-    # ----------------- Coder Agent: открытие issue -----------------
-    if x_github_event == "issues" and payload.get("action") == "opened":
-        issue_number = payload["issue"]["number"]
-        issue_title = payload["issue"]["title"]
-        issue_body = payload["issue"].get("body", "")
-        comments = await get_issue_comments(client, repo_full_name, issue_number)
-
-        repo_files = client.list_files(repo_full_name)
-        allowed_files = []
-        files_context = []
-
-        for path in repo_files:
-            content = client.get_file_content(repo_full_name, path, ref="main")
-            if content is not None:
-                allowed_files.append(path)
-                files_context.append(f"=== {path} ===\n{content}")
-
-        context = (
-            f"Issue: {issue_title}\n"
-            f"Описание: {issue_body}\n"
-            f"Комментарии:\n" + "\n".join(comments) + "\n\n" +
-            "Содержимое файлов репозитория:\n" + "\n\n".join(files_context)
-        )
-
-        files_to_update = await run_coder_agent(context, allowed_files=repo_files)
-
-        branch_name = f"issue-{issue_number}-fix"
-        client.create_branch(repo_full_name, branch_name)
-
-        for path, content in files_to_update.items():
-            client.create_or_update_file(
-                repo_full_name,
-                branch_name,
-                path,
-                content,
-                f"Issue #{issue_number} fix via Coder Agent"
-            )
-
-        pr = client.create_pull_request(
-            repo_full_name,
-            f"Fix for issue #{issue_number}",
-            branch_name,
-            "main",
-            body=f"Issue #{issue_number} fix via Coder Agent"
-        )
-
-        # Инициализируем итерацию
-        PR_ITERATIONS[pr.number] = 1
-
-        return {"status": "coder agent completed"}
-
-    # ----------------- Reviewer Agent: CI завершился -----------------
-    elif x_github_event == "check_run" and payload.get("action") == "completed":
-        prs = payload["check_run"].get("pull_requests", [])
-        if not prs:
-            return {"status": "check_run without PR"}
-
-        pr_number = prs[0]["number"]
-        pr = client.get_pull_request(repo_full_name, pr_number)
-        pr_title = pr.title
-        pr_body = pr.body or ""
-        diff_text = await get_pr_diff(client, repo_full_name, pr_number)
-        conclusion = payload["check_run"]["conclusion"]
-
-        context = (
-            f"PR: {pr_title}\n"
-            f"Описание: {pr_body}\n"
-            f"Diff:\n{diff_text}\n"
-            f"CI статус: {conclusion}"
-        )
-
-        review_comment = await run_reviewer_agent(context)
-        client.add_pr_comment(repo_full_name, pr_number, review_comment)
-
-        return {"status": "reviewer agent completed"}
-
-    # ----------------- Coder Agent: реагирование на комментарий ревьювера -----------------
-    elif x_github_event == "issue_comment" and payload.get("action") == "created":
-        comment = payload["comment"]["body"]
-
-        if not is_reviewer_comment(comment):
-            return {"status": "not reviewer comment"}
-
-        pr_url = payload["issue"]["pull_request"]["url"]
-        pr_number = client.get_pr_number_from_url(pr_url)  # метод для получения PR номера
-
-        # Проверка лимита итераций
-        PR_ITERATIONS[pr_number] += 1
-        if PR_ITERATIONS[pr_number] > MAX_ITERATIONS:
-            client.add_pr_comment(
-                repo_full_name,
-                pr_number,
-                "[SYSTEM] Max iterations reached. Manual intervention required."
-            )
-            return {"status": "max iterations reached"}
-
-        # Разбираем вердикт reviewer
-        verdict = "request changes" if "request changes" in comment.lower() else "approve"
-        if verdict == "approve":
-            return {"status": "review approved"}
-
-        # Подготовка контекста для coder
-        pr = client.get_pull_request(repo_full_name, pr_number)
-        pr_title = pr.title
-        pr_body = pr.body or ""
-        diff_text = await get_pr_diff(client, repo_full_name, pr_number)
-
-        context = (
-            f"PR: {pr_title}\n"
-            f"Описание: {pr_body}\n"
-            f"Текущий diff:\n{diff_text}\n\n"
-            f"Комментарий ревьювера:\n{comment}\n\n"
-            f"Итерация: {PR_ITERATIONS[pr_number]} из {MAX_ITERATIONS}"
-        )
-
-        pr_files = pr.get_files()
-        allowed_files = [f.filename for f in pr_files]
-
-        files_to_update = await run_coder_agent(context, allowed_files=allowed_files)
-        branch_name = pr.head.ref
+    installation_id = payload.installation.id
+    repo_full_name = payload.repository.full_name
 
-        for path, content in files_to_update.items():
-            client.create_or_update_file(
-                repo_full_name,
-                branch_name,
-                path,
-                content,
-                f"Fix after review iteration {PR_ITERATIONS[pr_number]}"
-            )
+    if x_github_event in _CACHE_INVALIDATING_EVENTS:
+        invalidate_pr_cache(repo_full_name, payload.pull_request.number if payload.pull_request else None)
+        return _OK
 
-        return {"status": "coder iteration completed"}
+    handler = HANDLERS.get((x_github_event, payload.action))
+    if handler is None:
+        logger.info("Unhandled event action: %s.%s", x_github_event, payload.action)
+        return _OK
 
-    logger.info("Unhandled event type: %s", x_github_event)
-    return {"status": "ok"}
+    client = await asyncio.to_thread(get_installation_client, installation_id)
+    return await handler(payload, client, repo_full_name)
@@ -1,12 +1,324 @@
+import asyncio
+import base64
+import functools
+import fcntl
+import hashlib
+import os
+import re
+import stat
+import subprocess
 import jwt
 import time
+import threading
+from collections import OrderedDict, deque
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.types import PrivateKeyTypes
 
 logger = logging.getLogger("github_app.client")
-from github import Github
+from github import Auth, Github, InputGitTreeElement, UnknownObjectException
+from github.Repository import Repository
+
+from main.config import GITHUB_APP_ID, GITHUB_PRIVATE_KEY_PATH, REPO_CACHE_DIR
+
+# Токен обновляем заранее, если до истечения осталось меньше этого запаса
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+# installation_id -> (token, expires_at epoch), общий для всех экземпляров клиента
+_TOKEN_CACHE: dict[int, tuple[str, float]] = {}
+_TOKEN_LOCK = threading.Lock()
+# Отдельная блокировка на installation: параллельные webhook ждут одно обновление, а не шлют свои
+_TOKEN_REFRESH_LOCKS: dict[int, threading.Lock] = {}
+_PRIVATE_KEY: PrivateKeyTypes | None = None
+
+# JWT GitHub App живет 10 минут; переиспользуем его с запасом в минуту
+JWT_LIFETIME_SECONDS = 600
+JWT_REFRESH_MARGIN_SECONDS = 60
+# app_id -> (jwt, заголовки запросов от имени приложения, reuse_until epoch)
+_JWT_CACHE: dict[str, tuple[str, dict[str, str], float]] = {}
+# Когда JWT последний раз понадобился; фоновый перевыпуск продолжается, только пока он нужен
+_JWT_LAST_USED = 0.0
+
+# Фоновое обновление до истечения, чтобы подпись JWT и обмен токена не попадали на путь webhook.
+# Токен обновляем раньше, чем get_cached_installation_token перестанет его отдавать
+JWT_BACKGROUND_REFRESH_SECONDS = 90
+TOKEN_BACKGROUND_REFRESH_SECONDS = 300
+# "jwt" или installation_id -> запланированный таймер обновления
+_REFRESH_TIMERS: dict[str | int, threading.Timer] = {}
+
+# Повторы на 429/5xx с экспоненциальной паузой и учетом Retry-After — только для _SESSION:
+# через нее идут чтения и обмен токена, повтор которых безопасен. PyGithub оставляем его
+# GithubRetry: он обрабатывает secondary rate limit (403) и не повторяет POST
+_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET", "POST"],
+    respect_retry_after_header=True,
+)
+
+# Общие заголовки прямых запросов к GitHub: сжатие ответов, постоянный User-Agent и версия API
+GITHUB_DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip",
+    "User-Agent": "mega-current-test/1.0",
+    "X-GitHub-Api-Version": "2022-11-28",
+}
+
+# Синхронная сессия с keep-alive для GitHub API, общая для всех экземпляров клиента.
+# Одновременных запросов не больше, чем соединений в пуле, чтобы urllib3 не выбрасывал лишние
+SESSION_MAX_CONNECTIONS = 64
+_SESSION = requests.Session()
+_SESSION.headers.update(GITHUB_DEFAULT_HEADERS)
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=SESSION_MAX_CONNECTIONS, max_retries=_RETRY))
+
+# Общий async-клиент для прямых вызовов GitHub REST API (keep-alive между webhook)
+GITHUB_API_URL = "https://api.github.com"
+_HTTP = httpx.AsyncClient(
+    base_url=GITHUB_API_URL,
+    headers=GITHUB_DEFAULT_HEADERS,
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=64),
+)
+BLOB_FETCH_CONCURRENCY = 64
+# Запросы, создающие контент, GitHub ограничивает secondary rate limit — их держим почти последовательными
+BLOB_WRITE_CONCURRENCY = 4
+
+# (url, Accept) -> (ETag, ответ); ответы 304 не расходуют primary rate limit
+ETAG_CACHE_SIZE = 1024
+_ETAG_CACHE: OrderedDict[tuple[str, str], tuple[str, httpx.Response]] = OrderedDict()
+
+
+async def conditional_get(url: str, headers: dict[str, str], params: dict | None = None) -> httpx.Response:
+    """GET через общий клиент с If-None-Match; на 304 возвращает ранее полученный ответ"""
+    key = (str(httpx.URL(url, params=params)), headers.get("Accept", ""))
+    cached = _ETAG_CACHE.get(key)
+    if cached is not None:
+        headers = {**headers, "If-None-Match": cached[0]}
+
+    resp = await _HTTP.get(url, params=params, headers=headers)
+    if resp.status_code == 304 and cached is not None:
+        _ETAG_CACHE.move_to_end(key)
+        return cached[1]
+
+    etag = resp.headers.get("ETag")
+    if resp.status_code == 200 and etag:
+        _ETAG_CACHE[key] = (etag, resp)
+        _ETAG_CACHE.move_to_end(key)
+        if len(_ETAG_CACHE) > ETAG_CACHE_SIZE:
+            _ETAG_CACHE.popitem(last=False)
+    return resp
+
+# То же для синхронных чтений через _SESSION: url -> (ETag, тело, до какого момента отдаем без запроса)
+_SESSION_ETAG_CACHE: OrderedDict[str, tuple[str | None, bytes, float]] = OrderedDict()
+_SESSION_ETAG_LOCK = threading.Lock()
+# Ответ по конкретному коммиту неизменен — кешируем его навсегда и не перепроверяем
+_COMMIT_SHA_RE = re.compile(r"[0-9a-f]{40}")
+# Не больше стольких одновременных синхронных запросов к api.github.com на процесс
+_SESSION_HOST_SEMAPHORE = threading.Semaphore(SESSION_MAX_CONNECTIONS)
+# Если осталось меньше стольких запросов, ждем сброса лимита (но не дольше RATE_LIMIT_MAX_SLEEP_SECONDS)
+RATE_LIMIT_LOW_WATERMARK = 50
+RATE_LIMIT_MAX_SLEEP_SECONDS = 60
+
+
+def is_commit_sha(ref: str) -> bool:
+    return _COMMIT_SHA_RE.fullmatch(ref) is not None
+
+
+def wait_for_rate_limit(resp: requests.Response):
+    """Притормаживает поток, если GitHub просит подождать или лимит почти исчерпан"""
+    delay = 0.0
+    retry_after = resp.headers.get("Retry-After")
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    if retry_after and retry_after.isdigit():
+        delay = float(retry_after)
+    elif remaining is not None and int(remaining) < RATE_LIMIT_LOW_WATERMARK:
+        delay = float(resp.headers.get("X-RateLimit-Reset", 0)) - time.time()
+    if delay > 0:
+        delay = min(delay, RATE_LIMIT_MAX_SLEEP_SECONDS)
+        logger.warning("GitHub rate limit is low remaining=%s, sleeping %.1fs", remaining, delay)
+        time.sleep(delay)
+
+
+def session_conditional_get(url: str, headers: dict[str, str], immutable: bool = False) -> bytes:
+    """GET через _SESSION с If-None-Match; на 304 возвращает ранее полученное тело"""
+    with _SESSION_ETAG_LOCK:
+        cached = _SESSION_ETAG_CACHE.get(url)
+        if cached is not None:
+            _SESSION_ETAG_CACHE.move_to_end(url)
+    if cached is not None:
+        if time.time() < cached[2]:
+            return cached[1]
+        if cached[0]:
+            headers = {**headers, "If-None-Match": cached[0]}
+
+    with _SESSION_HOST_SEMAPHORE:
+        resp = _SESSION.get(url, headers=headers, timeout=30)
+    wait_for_rate_limit(resp)
+    if resp.status_code == 304 and cached is not None:
+        return cached[1]
+    resp.raise_for_status()
+
+    etag = resp.headers.get("ETag")
+    if immutable or etag:
+        with _SESSION_ETAG_LOCK:
+            _SESSION_ETAG_CACHE[url] = (etag, resp.content, float("inf") if immutable else 0.0)
+            _SESSION_ETAG_CACHE.move_to_end(url)
+            if len(_SESSION_ETAG_CACHE) > ETAG_CACHE_SIZE:
+                _SESSION_ETAG_CACHE.popitem(last=False)
+    return resp.content
+
+# Ограничения на файлы, которые попадают в контекст LLM
+MAX_FILE_SIZE = 100_000
+SKIPPED_DIRS = {".git", "node_modules", "dist"}
+BINARY_EXTS = {
+    "png", "jpg", "jpeg", "gif", "bmp", "ico", "webp", "pdf", "zip", "gz", "tar", "7z",
+    "jar", "exe", "dll", "so", "dylib", "bin", "pyc", "woff", "woff2", "ttf", "otf",
+    "mp3", "mp4", "mov", "avi", "sqlite3", "db",
+}
+
+
+def is_skipped_path(path: str) -> bool:
+    """Файлы из служебных/сборочных каталогов в контекст не берем вовсе"""
+    return any(part in SKIPPED_DIRS for part in path.split("/"))
+
+
+def is_binary_path(path: str) -> bool:
+    """Определяет заведомо бинарный файл по расширению, не скачивая его"""
+    name = path.rsplit("/", 1)[-1]
+    return "." in name and name.rsplit(".", 1)[-1].lower() in BINARY_EXTS
+
+
+# Как в git: NUL-байт в начале файла — признак бинарного содержимого
+BINARY_SNIFF_BYTES = 8192
+
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA-1 blob'а так, как его считает git (и GitHub в поле sha)"""
+    return hashlib.sha1(b"blob %d\x00" % len(data) + data).hexdigest()
+
+
+def decode_text(raw: bytes) -> str | None:
+    """
+    Декодирует текстовый файл; для бинарного возвращает None, не декодируя его целиком.
+    Не-UTF-8 текст тоже None: замена байтов на U+FFFD испортила бы файл при записи обратно
+    """
+    if b"\x00" in raw[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+# Локальные shallow-клоны: внутри процесса — asyncio.Lock, между воркерами — flock на файле
+_CLONE_LOCKS: dict[str, asyncio.Lock] = {}
+# git выполняется под обеими блокировками: зависший fetch не должен держать их вечно.
+# По таймауту read_repo_files откатывается на Git Trees API
+GIT_TIMEOUT_SECONDS = 120
+# fetch медленнее GIT_LOW_SPEED_LIMIT байт/с дольше GIT_LOW_SPEED_TIME секунд git обрывает сам
+GIT_LOW_SPEED_LIMIT = 1000
+GIT_LOW_SPEED_TIME = 30
+
+
+def _run_git(args: list[str], cwd: Path | None = None, env: dict[str, str] | None = None):
+    result = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env={**os.environ, **env} if env else None,
+        timeout=GIT_TIMEOUT_SECONDS,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git failed: {result.stderr.strip()}")
+
+
+def _read_local_files(root: Path) -> dict[str, str | None]:
+    files = {}
+    # Симлинки не читаем: закоммиченная ссылка на /proc/self/environ или ключ App
+    # иначе попала бы в промпт. os.walk не заходит в ссылки на каталоги, lstat отсекает ссылки на файлы
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIPPED_DIRS]
+        for name in filenames:
+            file = Path(dirpath, name)
+            st = file.lstat()
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            path = file.relative_to(root).as_posix()
+            if is_binary_path(path) or st.st_size > MAX_FILE_SIZE:
+                files[path] = None
+                continue
+            files[path] = decode_text(file.read_bytes())
+    return files
+
+
+def get_cached_installation_token(installation_id: int) -> str | None:
+    """Токен из кеша, если до его истечения больше TOKEN_REFRESH_MARGIN_SECONDS"""
+    with _TOKEN_LOCK:
+        cached = _TOKEN_CACHE.get(installation_id)
+    if cached is not None and cached[1] - time.time() > TOKEN_REFRESH_MARGIN_SECONDS:
+        return cached[0]
+    return None
+
+
+def _get_token_refresh_lock(installation_id: int) -> threading.Lock:
+    with _TOKEN_LOCK:
+        return _TOKEN_REFRESH_LOCKS.setdefault(installation_id, threading.Lock())
+
+
+def _run_background_refresh(refresh):
+    try:
+        refresh()
+    except Exception:
+        logger.warning("Background refresh failed, will refresh on demand", exc_info=True)
+
+
+def schedule_refresh(key: str | int, delay: float, refresh):
+    """Планирует refresh через delay секунд, заменяя ранее запланированный для key"""
+    timer = threading.Timer(max(delay, 0.0), _run_background_refresh, (refresh,))
+    timer.daemon = True
+    with _TOKEN_LOCK:
+        previous = _REFRESH_TIMERS.get(key)
+        _REFRESH_TIMERS[key] = timer
+    if previous is not None:
+        previous.cancel()
+    timer.start()
+
+
+def load_private_key() -> PrivateKeyTypes:
+    """Читает и разбирает PEM приватного ключа GitHub App один раз за процесс"""
+    global _PRIVATE_KEY
+    if _PRIVATE_KEY is None:
+        try:
+            with open(GITHUB_PRIVATE_KEY_PATH, "rb") as f:
+                _PRIVATE_KEY = serialization.load_pem_private_key(f.read(), password=None)
+        except Exception:
+            logger.exception("Failed to read private key")
+            raise
+    return _PRIVATE_KEY
+
+class InstallationTokenAuth(Auth.Auth):
+    """Auth для PyGithub: на каждый запрос подставляет актуальный токен из общего кеша"""
+
+    def __init__(self, client: "GitHubAppClient"):
+        self._client = client
+
+    @property
+    def token_type(self) -> str:
+        return "token"
+
+    @property
+    def token(self) -> str:
+        return self._client.token
 
-from main.config import GITHUB_APP_ID, GITHUB_PRIVATE_KEY_PATH
 
 class GitHubAppClient:
     def __init__(self, installation_id: int):
@@ -16,71 +328,148 @@ class GitHubAppClient:
             installation_id,
         )
 
-        self.token = self.get_installation_token()
-        self.client = Github(self.token)
+        # Токен получаем сразу, чтобы ошибка авторизации всплыла при создании клиента
+        self.get_installation_token()
+        self.client = Github(auth=InstallationTokenAuth(self))
+        # Каждый helper начинает с get_repo; без кеша это лишний запрос /repos/{o}/{r} на вызов
+        self._repo_cache: dict[str, Repository] = {}
+
+    @property
+    def token(self) -> str:
+        """
+        Installation token читается из кеша на каждый вызов, а не фиксируется при создании
+        клиента: webhook, долго ждавший LLM, не придет к GitHub с истекшим токеном.
+        Может блокировать на обмене токена — только для PyGithub и синхронных методов в потоках;
+        async-методы берут заголовки через _auth_headers
+        """
+        return self.get_installation_token()
 
     def get_jwt(self):
+        global _JWT_LAST_USED
+        cached = _JWT_CACHE.get(GITHUB_APP_ID)
+        token = cached[0] if cached is not None and time.time() < cached[2] else self.mint_jwt()
+        _JWT_LAST_USED = time.time()
+        return token
+
+    def mint_jwt(self):
         logger.debug(
             "Generating JWT (app_id=%s)",
             GITHUB_APP_ID,
         )
 
-        try:
-            with open(GITHUB_PRIVATE_KEY_PATH, "r") as f:
-                private_key = f.read()
-        except Exception:
-            logger.exception("Failed to read private key")
-            raise
+        private_key = load_private_key()
 
+        iat = int(time.time())
         payload = {
-            "iat": int(time.time()),
-            "exp": int(time.time()) + 600,
+            "iat": iat,
+            "exp": iat + JWT_LIFETIME_SECONDS,
             "iss": GITHUB_APP_ID,
         }
 
         token = jwt.encode(payload, private_key, algorithm="RS256")
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+        }
+        _JWT_CACHE[GITHUB_APP_ID] = (token, headers, iat + JWT_LIFETIME_SECONDS - JWT_REFRESH_MARGIN_SECONDS)
         logger.debug("JWT generated successfully")
+        schedule_refresh(
+            "jwt",
+            JWT_LIFETIME_SECONDS - JWT_BACKGROUND_REFRESH_SECONDS,
+            functools.partial(self.refresh_jwt, iat),
+        )
 
         return token
 
+    def refresh_jwt(self, minted_at: float):
+        """Фоновый перевыпуск JWT; если с прошлого выпуска JWT никому не понадобился — останавливаемся"""
+        if _JWT_LAST_USED < minted_at:
+            logger.debug("JWT is unused, stopping background refresh")
+            return
+        self.mint_jwt()
+
+    def get_jwt_headers(self) -> dict[str, str]:
+        """Заголовки с JWT собираются один раз при выпуске токена и переиспользуются"""
+        self.get_jwt()
+        return _JWT_CACHE[GITHUB_APP_ID][1]
+
     def get_installation_token(self):
+        token = get_cached_installation_token(self.installation_id)
+        if token is None:
+            with _get_token_refresh_lock(self.installation_id):
+                # Пока ждали блокировку, токен мог обновить другой поток
+                token = get_cached_installation_token(self.installation_id)
+                if token is None:
+                    return self.request_installation_token()
+
+        logger.debug(
+            "Using cached installation token installation_id=%s",
+            self.installation_id,
+        )
+        return token
+
+    def request_installation_token(self):
         logger.info(
             "Requesting installation token installation_id=%s",
             self.installation_id,
         )
 
-        jwt_token = self.get_jwt()
         url = (
             f"https://api.github.com/app/installations/"
             f"{self.installation_id}/access_tokens"
         )
 
-        headers = {
-            "Authorization": f"Bearer {jwt_token}",
-            "Accept": "application/vnd.github+json",
-        }
-
         try:
-            resp = requests.post(url, headers=headers, timeout=10)
-            logger.debug(
-                "GitHub token response status=%s body=%s",
-                resp.status_code,
-                resp.text,
-            )
+            resp = _SESSION.post(url, headers=self.get_jwt_headers(), timeout=10)
+            # Тело не логируем: в нем сам токен
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "GitHub token response status=%s request_id=%s",
+                    resp.status_code,
+                    resp.headers.get("X-GitHub-Request-Id"),
+                )
             resp.raise_for_status()
         except Exception:
             logger.exception("Failed to obtain installation token")
             raise
 
-        token = resp.json()["token"]
+        obtained_at = time.time()
+        data = orjson.loads(resp.content)
+        token = data["token"]
+        expires_at = datetime.fromisoformat(data["expires_at"].replace("Z", "+00:00")).timestamp()
+        with _TOKEN_LOCK:
+            _TOKEN_CACHE[self.installation_id] = (token, expires_at)
         logger.info("Installation token obtained successfully")
+        schedule_refresh(
+            self.installation_id,
+            expires_at - obtained_at - TOKEN_BACKGROUND_REFRESH_SECONDS,
+            functools.partial(self.refresh_installation_token, obtained_at),
+        )
 
         return token
 
-    def get_repo(self, full_name: str):
+    def refresh_installation_token(self, obtained_at: float):
+        """
+        Фоновое обновление токена. Если installation вытеснена из кеша клиентов или ее клиент
+        не выдавали с момента получения текущего токена — цепочка обновлений прекращается
+        """
+        with _CLIENTS_LOCK:
+            entry = _CLIENTS.get(self.installation_id)
+        if entry is None or entry[1] < obtained_at:
+            logger.debug("Installation is idle, stopping token refresh installation_id=%s", self.installation_id)
+            return
+        with _get_token_refresh_lock(self.installation_id):
+            self.request_installation_token()
+
+    def get_repo(self, full_name: str) -> Repository:
+        repo = self._repo_cache.get(full_name)
+        if repo is not None:
+            return repo
+
         logger.debug("Fetching repo full_name=%s", full_name)
         try:
             repo = self.client.get_repo(full_name)
+            self._repo_cache[full_name] = repo
             logger.debug("Repo fetched successfully full_name=%s", full_name)
             return repo
         except Exception:
@@ -182,7 +571,7 @@ class GitHubAppClient:
         content: str,
         message: str,
     ):
-        logger.info(
+        logger.debug(
             "Create/update file repo=%s branch=%s path=%s",
             repo_full_name,
             branch,
@@ -193,36 +582,107 @@ class GitHubAppClient:
 
         try:
             f = repo.get_contents(path, ref=branch)
-            logger.debug("File exists, updating path=%s", path)
+        except UnknownObjectException:
+            f = None
 
-            repo.update_file(
-                path,
-                message,
-                content,
-                f.sha,
-                branch=branch,
-            )
-            logger.info("File updated successfully path=%s", path)
-        except Exception:
-            logger.debug("File not found, creating path=%s", path)
-            try:
-                repo.create_file(
+        try:
+            if f is not None and f.sha == git_blob_sha(content.encode("utf-8")):
+                logger.debug("File is unchanged, skipping update path=%s", path)
+            elif f is not None:
+                logger.debug("File exists, updating path=%s", path)
+                repo.update_file(
                     path,
                     message,
                     content,
+                    f.sha,
                     branch=branch,
                 )
-                logger.info("File created successfully path=%s", path)
-            except Exception:
-                logger.exception(
-                    "Failed to create/update file repo=%s path=%s",
-                    repo_full_name,
+                logger.debug("File updated successfully path=%s", path)
+            else:
+                logger.debug("File not found, creating path=%s", path)
+                repo.create_file(
                     path,
+                    message,
+                    content,
+                    branch=branch,
                 )
-                raise
+                logger.debug("File created successfully path=%s", path)
+        except Exception:
+            logger.exception(
+                "Failed to create/update file repo=%s path=%s",
+                repo_full_name,
+                path,
+            )
+            raise
+
+    async def commit_files(
+        self,
+        repo_full_name: str,
+        branch: str,
+        files: dict[str, str],
+        message: str,
+    ):
+        """
+        Записывает все файлы одним коммитом через Git Data API:
+        blob'ы создаются параллельно, затем одно дерево, один коммит и сдвиг ветки
+        """
+        if not files:
+            logger.info("Nothing to commit repo=%s branch=%s", repo_full_name, branch)
+            return None
 
-    def delete_file(self, repo_full_name: str, branch: str, path: str, message: str):
         logger.info(
+            "Committing files repo=%s branch=%s count=%s",
+            repo_full_name,
+            branch,
+            len(files),
+        )
+
+        try:
+            repo = self.get_repo(repo_full_name)
+            head = await asyncio.to_thread(repo.get_branch, branch)
+            parent = await asyncio.to_thread(repo.get_git_commit, head.commit.sha)
+            # Режим существующих файлов берем из дерева родителя, иначе правка снимет бит исполнения
+            parent_tree = await asyncio.to_thread(repo.get_git_tree, parent.tree.sha, recursive=True)
+            existing = {e.path: e for e in parent_tree.tree if e.type == "blob"}
+            # Файлы, чей blob совпадает с уже лежащим в ветке, не загружаем и не коммитим
+            files = {
+                p: c for p, c in files.items()
+                if p not in existing or existing[p].sha != git_blob_sha(c.encode("utf-8"))
+            }
+            if not files:
+                logger.info("Files are unchanged, skipping commit repo=%s branch=%s", repo_full_name, branch)
+                return None
+
+            sem = asyncio.Semaphore(BLOB_WRITE_CONCURRENCY)
+
+            async def create_blob(path: str, content: str) -> InputGitTreeElement:
+                async with sem:
+                    blob = await asyncio.to_thread(repo.create_git_blob, content, "utf-8")
+                mode = existing[path].mode if path in existing else "100644"
+                return InputGitTreeElement(path, mode, "blob", sha=blob.sha)
+
+            elements = await asyncio.gather(*(create_blob(p, c) for p, c in files.items()))
+
+            tree = await asyncio.to_thread(repo.create_git_tree, list(elements), parent.tree)
+            if tree.sha == parent.tree.sha:
+                logger.info("Files are unchanged, skipping commit repo=%s branch=%s", repo_full_name, branch)
+                return None
+            commit = await asyncio.to_thread(repo.create_git_commit, message, tree, [parent])
+            ref = await asyncio.to_thread(repo.get_git_ref, f"heads/{branch}")
+            await asyncio.to_thread(ref.edit, commit.sha)
+
+            logger.info("Files committed successfully sha=%s", commit.sha)
+            return commit
+        except Exception:
+            logger.exception(
+                "Failed to commit files repo=%s branch=%s",
+                repo_full_name,
+                branch,
+            )
+            raise
+
+    def delete_file(self, repo_full_name: str, branch: str, path: str, message: str):
+        logger.debug(
             "Deleting file repo=%s branch=%s path=%s",
             repo_full_name,
             branch,
@@ -232,7 +692,7 @@ class GitHubAppClient:
             repo = self.get_repo(repo_full_name)
             f = repo.get_contents(path, ref=branch)
             repo.delete_file(path, message, f.sha, branch=branch)
-            logger.info("File deleted successfully path=%s", path)
+            logger.debug("File deleted successfully path=%s", path)
         except Exception:
             logger.exception("Failed to delete file path=%s", path)
             raise
@@ -243,14 +703,17 @@ class GitHubAppClient:
         """
         logger.debug("Reading file repo=%s ref=%s path=%s", repo_full_name, ref, path)
         try:
-            repo = self.get_repo(repo_full_name)
-            f = repo.get_contents(path, ref=ref)
+            # PyGithub не отдает заголовки, поэтому читаем напрямую: нужен ETag для If-None-Match
+            content = session_conditional_get(
+                f"{GITHUB_API_URL}/repos/{repo_full_name}/contents/{quote(path)}?ref={quote(ref, safe='')}",
+                {"Authorization": f"token {self.token}", "Accept": "application/vnd.github.raw"},
+                immutable=is_commit_sha(ref),
+            )
 
-            try:
-                return f.decoded_content.decode("utf-8")
-            except UnicodeDecodeError:
-                logger.info("Skipping binary file %s", path)
-                return None
+            text = decode_text(content)
+            if text is None:
+                logger.debug("Skipping binary file %s", path)
+            return text
         except Exception:
             logger.exception("Failed to read file path=%s", path)
             return None
@@ -258,16 +721,21 @@ class GitHubAppClient:
     def list_files(self, repo_full_name: str, path: str = "", ref: str = "main"):
         logger.info("Listing files repo=%s ref=%s path=%s", repo_full_name, ref, path)
         try:
-            repo = self.get_repo(repo_full_name)
-            result = []
-            contents = repo.get_contents(path, ref=ref)
-
-            while contents:
-                item = contents.pop(0)
-                if item.type == "dir":
-                    contents.extend(repo.get_contents(item.path, ref=ref))
-                else:
-                    result.append(item.path)
+            # trees API принимает и sha, и имя ветки — все дерево одним запросом
+            tree = orjson.loads(session_conditional_get(
+                f"{GITHUB_API_URL}/repos/{repo_full_name}/git/trees/{quote(ref)}?recursive=1",
+                {"Authorization": f"token {self.token}", "Accept": "application/vnd.github+json"},
+                immutable=is_commit_sha(ref),
+            ))
+            if tree.get("truncated"):
+                logger.warning("Tree is truncated repo=%s ref=%s, walking directories", repo_full_name, ref)
+                result = self._walk_files(self.get_repo(repo_full_name), path, ref)
+            else:
+                prefix = f"{path.strip('/')}/" if path else ""
+                result = [
+                    e["path"] for e in tree["tree"]
+                    if e["type"] == "blob" and e["path"].startswith(prefix) and not is_skipped_path(e["path"])
+                ]
 
             logger.info("Files listed count=%s", len(result))
             return result
@@ -275,6 +743,235 @@ class GitHubAppClient:
             logger.exception("Failed to list files repo=%s", repo_full_name)
             return []
 
+    def _walk_files(self, repo: Repository, path: str, ref: str) -> list[str]:
+        """Обход каталогов через contents API — запрос на каждый каталог"""
+        result = []
+        contents = deque(repo.get_contents(path, ref=ref))
+
+        while contents:
+            item = contents.popleft()
+            if is_skipped_path(item.path):
+                continue
+            if item.type == "dir":
+                contents.extend(repo.get_contents(item.path, ref=ref))
+            else:
+                result.append(item.path)
+        return result
+
+    async def _auth_headers(self, accept: str = "application/vnd.github+json") -> dict[str, str]:
+        """
+        Заголовки для async-методов. self.token может уйти в блокирующий обмен токена,
+        поэтому при промахе кеша обновляем его в потоке, а не в event loop
+        """
+        token = get_cached_installation_token(self.installation_id)
+        if token is None:
+            token = await asyncio.to_thread(self.get_installation_token)
+        return {"Authorization": f"token {token}", "Accept": accept}
+
+    async def get_issue_comment_bodies(self, repo_full_name: str, issue_number: int) -> list[str]:
+        """Тексты всех комментариев issue/PR через REST с условными запросами"""
+        logger.info("Fetching issue comments repo=%s issue_number=%s", repo_full_name, issue_number)
+        headers = await self._auth_headers()
+        bodies = []
+        url = f"/repos/{repo_full_name}/issues/{issue_number}/comments"
+        params = {"per_page": "100"}
+        try:
+            while url:
+                resp = await conditional_get(url, headers, params)
+                resp.raise_for_status()
+                bodies.extend(c["body"] or "" for c in orjson.loads(resp.content))
+                url = resp.links.get("next", {}).get("url")
+                params = None
+        except Exception:
+            logger.exception(
+                "Failed to fetch issue comments repo=%s issue_number=%s",
+                repo_full_name,
+                issue_number,
+            )
+            raise
+        return bodies
+
+    async def get_combined_ci_state(self, repo_full_name: str, pr_number: int) -> str:
+        """
+        Итоговый CI статус head-коммита PR: success/failure/pending или no_ci.
+        GitHub сам сводит статусы в поле state, перебирать их не нужно
+        """
+        logger.info("Fetching CI status repo=%s pr_number=%s", repo_full_name, pr_number)
+        headers = await self._auth_headers()
+        try:
+            resp = await conditional_get(f"/repos/{repo_full_name}/pulls/{pr_number}", headers)
+            resp.raise_for_status()
+            sha = orjson.loads(resp.content)["head"]["sha"]
+
+            resp = await conditional_get(f"/repos/{repo_full_name}/commits/{sha}/status", headers)
+            resp.raise_for_status()
+            data = orjson.loads(resp.content)
+        except Exception:
+            logger.exception("Failed to fetch CI status repo=%s pr_number=%s", repo_full_name, pr_number)
+            raise
+        return data["state"] if data["total_count"] > 0 else "no_ci"
+
+    async def get_pull_request_diff(self, repo_full_name: str, pr_number: int) -> str:
+        """Скачивает diff PR в текстовом виде; при ошибке возвращает пустую строку"""
+        logger.info("Fetching PR diff repo=%s pr_number=%s", repo_full_name, pr_number)
+        headers = await self._auth_headers("application/vnd.github.v3.diff")
+        try:
+            resp = await conditional_get(f"/repos/{repo_full_name}/pulls/{pr_number}", headers)
+        except Exception:
+            logger.exception("Failed to fetch PR diff repo=%s pr_number=%s", repo_full_name, pr_number)
+            return ""
+        return resp.text if resp.status_code == 200 else ""
+
+    async def list_and_fetch_tree(self, repo_full_name: str, ref: str = "main") -> dict[str, str | None]:
+        """
+        Возвращает {путь: содержимое} для всех файлов ветки ref за один запрос дерева
+        и параллельную загрузку blob'ов. Для бинарных и слишком больших файлов
+        содержимое None, они не скачиваются
+        """
+        logger.info("Fetching tree repo=%s ref=%s", repo_full_name, ref)
+        headers = await self._auth_headers()
+        try:
+            resp = await conditional_get(f"/repos/{repo_full_name}/git/ref/heads/{ref}", headers)
+            resp.raise_for_status()
+            commit_sha = orjson.loads(resp.content)["object"]["sha"]
+
+            resp = await _HTTP.get(
+                f"/repos/{repo_full_name}/git/trees/{commit_sha}",
+                params={"recursive": "1"},
+                headers=headers,
+            )
+            resp.raise_for_status()
+            tree = orjson.loads(resp.content)
+        except Exception:
+            logger.exception("Failed to fetch tree repo=%s ref=%s", repo_full_name, ref)
+            return {}
+
+        if tree.get("truncated"):
+            # Дерево слишком большое для одного ответа — обходим каталоги через PyGithub
+            logger.warning("Tree is truncated repo=%s ref=%s, falling back to contents API", repo_full_name, ref)
+            paths = await asyncio.to_thread(self.list_files, repo_full_name, "", ref)
+            return await self.fetch_files_concurrently(repo_full_name, paths, ref)
+
+        blobs = [
+            item for item in tree["tree"]
+            if item["type"] == "blob" and not is_skipped_path(item["path"])
+        ]
+        sem = asyncio.Semaphore(BLOB_FETCH_CONCURRENCY)
+
+        async def fetch_blob(item: dict) -> tuple[str, str | None]:
+            if is_binary_path(item["path"]) or item.get("size", 0) > MAX_FILE_SIZE:
+                return item["path"], None
+            async with sem:
+                try:
+                    resp = await _HTTP.get(
+                        f"/repos/{repo_full_name}/git/blobs/{item['sha']}",
+                        headers=headers,
+                    )
+                    resp.raise_for_status()
+                    raw = base64.b64decode(orjson.loads(resp.content)["content"])
+                except Exception:
+                    logger.exception("Failed to fetch blob path=%s", item["path"])
+                    return item["path"], None
+            text = decode_text(raw)
+            if text is None:
+                logger.debug("Skipping binary file %s", item["path"])
+            return item["path"], text
+
+        results = await asyncio.gather(*(fetch_blob(item) for item in blobs))
+        logger.info("Tree fetched files=%s", len(results))
+        return dict(results)
+
+    def _sync_local_clone(self, repo_full_name: str, ref: str) -> Path:
+        path = Path(REPO_CACHE_DIR) / repo_full_name
+        url = f"https://github.com/{repo_full_name}.git"
+        auth = base64.b64encode(f"x-access-token:{self.token}".encode()).decode()
+        if not (path / ".git").exists():
+            path.mkdir(parents=True, exist_ok=True)
+            _run_git(["init", "-q"], cwd=path)
+        # Токен передаем через окружение: не оседает в .git/config и не виден в argv процесса
+        _run_git(
+            ["fetch", "-q", "--depth=1", url, ref],
+            cwd=path,
+            env={
+                "GIT_CONFIG_COUNT": "3",
+                "GIT_CONFIG_KEY_0": "http.extraHeader",
+                "GIT_CONFIG_VALUE_0": f"Authorization: Basic {auth}",
+                "GIT_CONFIG_KEY_1": "http.lowSpeedLimit",
+                "GIT_CONFIG_VALUE_1": str(GIT_LOW_SPEED_LIMIT),
+                "GIT_CONFIG_KEY_2": "http.lowSpeedTime",
+                "GIT_CONFIG_VALUE_2": str(GIT_LOW_SPEED_TIME),
+                "GIT_TERMINAL_PROMPT": "0",
+            },
+        )
+        _run_git(["reset", "-q", "--hard", "FETCH_HEAD"], cwd=path)
+        _run_git(["clean", "-q", "-fdx"], cwd=path)
+        return path
+
+    def _read_local_clone(self, repo_full_name: str, ref: str) -> dict[str, str | None]:
+        """
+        fetch --depth=1 на каждый вызов (передаются только изменения) и чтение файлов.
+        REPO_CACHE_DIR общий для воркеров uvicorn, поэтому все под межпроцессным flock
+        """
+        lock_path = Path(REPO_CACHE_DIR) / f"{repo_full_name}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            path = self._sync_local_clone(repo_full_name, ref)
+            return _read_local_files(path)
+
+    async def read_repo_files(self, repo_full_name: str, ref: str = "main") -> dict[str, str | None]:
+        """
+        {путь: содержимое} всех файлов ветки из локального клона; если git недоступен,
+        откатывается на Git Trees API. Бинарные и большие файлы — None
+        """
+        lock = _CLONE_LOCKS.setdefault(repo_full_name, asyncio.Lock())
+        try:
+            async with lock:
+                logger.info("Syncing local clone repo=%s ref=%s", repo_full_name, ref)
+                return await asyncio.to_thread(self._read_local_clone, repo_full_name, ref)
+        except Exception:
+            logger.exception("Local clone failed repo=%s, falling back to tree API", repo_full_name)
+            return await self.list_and_fetch_tree(repo_full_name, ref)
+
+    async def fetch_files_concurrently(
+        self,
+        repo_full_name: str,
+        paths: list[str],
+        ref: str = "main",
+    ) -> dict[str, str | None]:
+        """
+        Параллельно читает файлы через fetch_file_content,
+        не больше BLOB_FETCH_CONCURRENCY запросов одновременно
+        """
+        sem = asyncio.Semaphore(BLOB_FETCH_CONCURRENCY)
+
+        async def fetch(path: str) -> tuple[str, str | None]:
+            async with sem:
+                return path, await self.fetch_file_content(repo_full_name, path, ref)
+
+        return dict(await asyncio.gather(*(fetch(p) for p in paths)))
+
+    async def fetch_file_content(self, repo_full_name: str, path: str, ref: str = "main") -> str | None:
+        """
+        Async-вариант get_file_content через общий httpx-клиент, без потока на запрос
+        """
+        logger.debug("Reading file repo=%s ref=%s path=%s", repo_full_name, ref, path)
+        try:
+            resp = await conditional_get(
+                f"/repos/{repo_full_name}/contents/{quote(path)}",
+                await self._auth_headers("application/vnd.github.raw"),
+                {"ref": ref},
+            )
+            resp.raise_for_status()
+        except Exception:
+            logger.exception("Failed to read file path=%s", path)
+            return None
+
+        text = decode_text(resp.content)
+        if text is None:
+            logger.debug("Skipping binary file %s", path)
+        return text
+
     def create_branch(self, repo_full_name: str, branch_name: str, base_branch: str = "main"):
         """
         Создает новую ветку branch_name от base_branch
@@ -305,13 +1002,60 @@ class GitHubAppClient:
             )
             raise
 
+    def delete_branch(self, repo_full_name: str, branch_name: str):
+        """
+        Удаляет ветку branch_name
+        """
+        logger.info("Deleting branch repo=%s branch_name=%s", repo_full_name, branch_name)
+
+        try:
+            repo = self.get_repo(repo_full_name)
+            repo.get_git_ref(f"heads/{branch_name}").delete()
+            logger.info("Branch deleted successfully branch_name=%s", branch_name)
+        except Exception:
+            logger.exception(
+                "Failed to delete branch repo=%s branch_name=%s",
+                repo_full_name,
+                branch_name,
+            )
+            raise
+
     def get_pr_number_from_url(self, pr_url: str) -> int:
         """
         Получает номер PR из полного API URL
         """
         try:
-            pr_number = int(pr_url.rstrip("/").split("/")[-1])
+            pr_number = int(pr_url.rstrip("/").rpartition("/")[2])
             return pr_number
         except Exception:
             logger.exception("Failed to parse PR number from URL: %s", pr_url)
             raise
+
+
+# Токен клиент берет из _TOKEN_CACHE на каждый запрос, поэтому сам клиент не устаревает;
+# число закешированных installation ограничено LRU. installation_id -> (клиент, когда выдан последний раз)
+MAX_CACHED_CLIENTS = 256
+_CLIENTS: OrderedDict[int, tuple[GitHubAppClient, float]] = OrderedDict()
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_installation_client(installation_id: int) -> GitHubAppClient:
+    """
+    Возвращает закешированный GitHubAppClient для installation_id,
+    создавая новый (JWT + installation token) только для новой installation
+    """
+    with _CLIENTS_LOCK:
+        entry = _CLIENTS.get(installation_id)
+        if entry is not None:
+            _CLIENTS[installation_id] = (entry[0], time.time())
+            _CLIENTS.move_to_end(installation_id)
+            return entry[0]
+
+    client = GitHubAppClient(installation_id)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(installation_id, (client, 0.0))[0]
+        _CLIENTS[installation_id] = (client, time.time())
+        _CLIENTS.move_to_end(installation_id)
+        if len(_CLIENTS) > MAX_CACHED_CLIENTS:
+            _CLIENTS.popitem(last=False)
+    return client
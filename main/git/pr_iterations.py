@@ -0,0 +1,63 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from main.config import PR_ITERATIONS_DB_PATH
+
+# Счетчик итераций живет сутки с первой итерации, как и сам цикл coder/reviewer
+PR_ITERATIONS_TTL = 86400
+
+
+class PRIterationStore:
+    """
+    Счетчик итераций coder/reviewer по PR в SQLite. Общий для всех воркеров uvicorn
+    и переживает рестарт, поэтому лимит MAX_ITERATIONS нельзя обойти.
+    """
+
+    def __init__(self, path: str, ttl: int = PR_ITERATIONS_TTL):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pr_iterations ("
+                "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _key(repo_full_name: str, pr_number: int) -> str:
+        return f"{repo_full_name}#{pr_number}"
+
+    def _set(self, key: str, value: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pr_iterations (key, count, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl),
+            )
+            self._conn.commit()
+
+    def _incr(self, key: str) -> int:
+        now = time.time()
+        with self._lock:
+            # Один UPSERT атомарен и между процессами; протухшая запись начинается заново
+            row = self._conn.execute(
+                "INSERT INTO pr_iterations (key, count, expires_at) VALUES (?, 1, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "count = CASE WHEN expires_at < ? THEN 1 ELSE count + 1 END, "
+                "expires_at = CASE WHEN expires_at < ? THEN excluded.expires_at ELSE expires_at END "
+                "RETURNING count",
+                (key, now + self.ttl, now, now),
+            ).fetchone()
+            self._conn.commit()
+            return row[0]
+
+    async def set(self, repo_full_name: str, pr_number: int, value: int):
+        await asyncio.to_thread(self._set, self._key(repo_full_name, pr_number), value)
+
+    async def incr(self, repo_full_name: str, pr_number: int) -> int:
+        return await asyncio.to_thread(self._incr, self._key(repo_full_name, pr_number))
+
+
+pr_iterations = PRIterationStore(PR_ITERATIONS_DB_PATH)
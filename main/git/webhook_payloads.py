@@ -0,0 +1,56 @@
+import msgspec
+
+
+# Только поля webhook, которые реально читает обработчик; остальное msgspec пропускает
+class Installation(msgspec.Struct):
+    id: int
+
+
+class Repository(msgspec.Struct):
+    full_name: str
+
+
+class IssuePullRequest(msgspec.Struct):
+    url: str
+
+
+class Issue(msgspec.Struct):
+    number: int
+    title: str
+    body: str | None = None
+    pull_request: IssuePullRequest | None = None
+
+
+class Comment(msgspec.Struct):
+    body: str
+
+
+class CheckRunPullRequest(msgspec.Struct):
+    number: int
+
+
+class CheckRun(msgspec.Struct):
+    conclusion: str | None = None
+    pull_requests: list[CheckRunPullRequest] = msgspec.field(default_factory=list)
+
+
+class PullRequest(msgspec.Struct):
+    number: int
+
+
+class WebhookPayload(msgspec.Struct):
+    installation: Installation
+    repository: Repository
+    action: str | None = None
+    issue: Issue | None = None
+    comment: Comment | None = None
+    check_run: CheckRun | None = None
+    pull_request: PullRequest | None = None
+
+
+_decoder = msgspec.json.Decoder(WebhookPayload)
+
+
+def decode_webhook_payload(body: bytes) -> WebhookPayload:
+    """Декодирует тело webhook сразу в типизированную структуру"""
+    return _decoder.decode(body)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
+from main.config import LLM_BATCH_POLL_INTERVAL, MODEL, USE_YANDEX_GPT, YANDEX_CLOUD_FOLDER, YANDEX_CLOUD_MODEL
+from main.llm.cache import llm_cache
+from main.llm.client import shared_client
+from main.llm.dispatcher import llm_slot
+
+TEMPERATURE = 0.3
+
+
+class LLMAgent:
+    """Универсальный агент для OpenRouter и YandexGPT через OpenAI SDK."""
+    def __init__(self, system_prompt: str, max_tokens: int, max_output_tokens: int):
+        """
+        max_tokens — лимит ответа для chat completions (OpenRouter),
+        max_output_tokens — для Responses API (YandexGPT).
+        """
+        self.client = shared_client
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.max_output_tokens = max_output_tokens
+        if USE_YANDEX_GPT:
+            self.model_id = f"gpt://{YANDEX_CLOUD_FOLDER}/{YANDEX_CLOUD_MODEL}"
+            self.is_yandex = True
+        else:
+            self.model_id = MODEL
+            self.is_yandex = False
+        self._system_message = self._build_system_message()
+
+    def _build_system_message(self) -> ChatCompletionSystemMessageParam:
+        """
+        System prompt идет первым и не меняется между вызовами, поэтому провайдер может
+        кешировать этот префикс. Anthropic требует явно пометить блок через cache_control.
+        """
+        if "anthropic/" in self.model_id or "claude" in self.model_id:
+            return {
+                "role": "system",
+                "content": [
+                    {"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}},
+                ],
+            }
+        return ChatCompletionSystemMessageParam(content=self.system_prompt, role="system")
+
+    async def run(self, prompt: str) -> str:
+        key = llm_cache.make_key(self.model_id, self.system_prompt, prompt, TEMPERATURE)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+        async with llm_slot():
+            response = await self._complete(prompt)
+        if response:
+            await llm_cache.set(key, response)
+        return response
+
+    async def _complete(self, prompt: str) -> str:
+        if self.is_yandex:
+            resp = await self.client.responses.create(
+                model=self.model_id,
+                instructions=self.system_prompt,
+                input=prompt,
+                temperature=TEMPERATURE,
+                max_output_tokens=self.max_output_tokens
+            )
+            return resp.output_text
+        else:
+            resp = await self.client.chat.completions.create(
+                model=self.model_id,
+                messages=[
+                    self._system_message,
+                    ChatCompletionUserMessageParam(content=prompt, role="user")
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=self.max_tokens
+            )
+            return resp.choices[0].message.content
+
+    async def run_batch(self, prompts: list[str]) -> list[str]:
+        """
+        Прогоняет промпты через OpenAI Batch API (дешевле, но ответ может идти минутами).
+        Подходит только для задач, которым не нужен немедленный ответ.
+        """
+        if self.is_yandex:
+            raise RuntimeError("Batch API is not supported for YandexGPT")
+
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.model_id,
+                    "messages": [
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    "temperature": TEMPERATURE,
+                    "max_tokens": self.max_tokens,
+                },
+            }, ensure_ascii=False)
+            for i, prompt in enumerate(prompts)
+        ]
+        batch_file = await self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode()),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(LLM_BATCH_POLL_INTERVAL)
+            batch = await self.client.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+
+        output = await self.client.files.content(batch.output_file_id)
+        results = [""] * len(prompts)
+        for line in output.text.splitlines():
+            item = json.loads(line)
+            body = (item.get("response") or {}).get("body") or {}
+            choices = body.get("choices") or []
+            if choices:
+                results[int(item["custom_id"])] = choices[0]["message"]["content"]
+        return results
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Protocol
+
+from main.config import LLM_CACHE_PATH, LLM_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> str | None: ...
+
+    async def set(self, key: str, value: str, ttl: int) -> None: ...
+
+
+class SqliteBackend:
+    """Хранилище ответов LLM в SQLite. Запросы уходят в поток, чтобы не блокировать event loop."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def _set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+
+class LLMCache:
+    """Кэш ответов LLM по sha256 от (model, system, prompt, temperature)."""
+
+    def __init__(self, backend: CacheBackend, ttl: int = LLM_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, system: str, prompt: str, temperature: float) -> str:
+        raw = json.dumps(
+            {"model": model, "system": system, "prompt": prompt, "temperature": temperature},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> str | None:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        logger.debug("LLM cache %s hits=%s misses=%s", "hit" if value is not None else "miss", self.hits, self.misses)
+        return value
+
+    async def set(self, key: str, value: str):
+        await self.backend.set(key, value, self.ttl)
+
+
+llm_cache = LLMCache(SqliteBackend(LLM_CACHE_PATH))
@@ -0,0 +1,23 @@
+import httpx
+import openai
+
+from main.config import OPENROUTER_API_KEY, USE_YANDEX_GPT, YANDEX_CLOUD_API_KEY, YANDEX_CLOUD_FOLDER
+
+# Один пул соединений на весь процесс: coder и reviewer переиспользуют keep-alive/HTTP2
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+    http2=True,
+)
+
+if USE_YANDEX_GPT:
+    shared_client = openai.AsyncOpenAI(
+        api_key=YANDEX_CLOUD_API_KEY,
+        base_url="https://rest-assistant.api.cloud.yandex.net/v1",
+        project=YANDEX_CLOUD_FOLDER,
+        http_client=_http_client,
+    )
+else:
+    shared_client = openai.AsyncOpenAI(
+        api_key=OPENROUTER_API_KEY,
+        http_client=_http_client,
+    )
@@ -0,0 +1,18 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiolimiter import AsyncLimiter
+
+from main.config import LLM_MAX_CONCURRENCY, LLM_MAX_REQUESTS_PER_MIN
+
+# Общие для всех агентов ограничения: число запросов в полёте и запросов в минуту
+_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+_limiter = AsyncLimiter(LLM_MAX_REQUESTS_PER_MIN, 60)
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Ожидает свободный слот под запрос к LLM с учетом concurrency и rate limit."""
+    async with _semaphore:
+        async with _limiter:
+            yield
@@ -1,4 +1,7 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
 LOG_FORMAT = (
@@ -7,10 +10,24 @@ LOG_FORMAT = (
 )
 
 def setup_logging(level=logging.INFO):
+    # Эти поля LogRecord в формате не используются — не тратим время на их заполнение
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    # Вызывающий код только кладет запись в очередь, в stdout пишет отдельный поток
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)  # важно для Docker
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    # Итоговый формат применяет stream_handler; здесь только текст, иначе формат удвоится
     logging.basicConfig(
         level=level,
-        format=LOG_FORMAT,
+        format="%(message)s",
         handlers=[
-            logging.StreamHandler(sys.stdout)  # важно для Docker
+            logging.handlers.QueueHandler(log_queue)
         ],
-    )
+    )
\ No newline at end of file